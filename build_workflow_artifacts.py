@@ -28,16 +28,46 @@ This script was inspired by and reuses the YAML extraction logic of extract_job_
 from __future__ import annotations
 
 import argparse
+import errno
+import functools
 import os
 import shutil
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Iterator, Optional, Tuple, List
 
 import yaml
 
+# Prefer the libyaml-backed implementations when PyYAML was built with them
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
+
+# rapidfuzz is optional; it provides a native common-prefix length for name matching
+try:
+    from rapidfuzz.distance import Prefix as _Prefix
+except ImportError:
+    _Prefix = None
 
 TEST_SUFFIXES = ("-test.yml", "-tests.yml")
+TEST_DATA_DIRS = ("test_data", "test-data")
+# Never descended into: test data is copied wholesale by its parent, the rest are not workflows
+SKIP_DIRS = frozenset(TEST_DATA_DIRS + (".git", "__pycache__", ".pytest_cache", ".venv"))
+# Only the filename tail needs case folding to match TEST_SUFFIXES
+_TEST_SUFFIX_LEN = max(len(suf) for suf in TEST_SUFFIXES)
+# (name, stem) pair for a classified file entry
+NameStem = Tuple[str, str]
+
+# copy_file_range errors meaning "not supported here"; _copyfile then copies in user space
+_COPY_FILE_RANGE_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL)
+# Per-directory work is I/O bound, so use more threads than cores
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 4)
+
+# Serializes log output from worker threads
+_log_lock = threading.Lock()
 
 
 def parse_args() -> argparse.Namespace:
@@ -46,16 +76,18 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--output-dir", required=True, type=Path, help="Path to the output directory")
     p.add_argument("--dry-run", action="store_true", help="Show what would be done without writing files")
     p.add_argument("--verbose", "-v", action="count", default=0, help="Increase verbosity (use -vv for more)")
+    p.add_argument(
+        "--jobs", "-j", type=int, default=DEFAULT_JOBS,
+        help=f"Number of workflow directories to process concurrently (default: {DEFAULT_JOBS})",
+    )
     return p.parse_args()
 
 
 def log(msg: str, *, level: str = "INFO", v: int = 0, args: argparse.Namespace | None = None) -> None:
-    if args is None:
-        print(f"[{level}] {msg}")
-        return
     # Only print if verbosity threshold is met
-    if args.verbose >= v:
-        print(f"[{level}] {msg}")
+    if args is None or args.verbose >= v:
+        with _log_lock:
+            print(f"[{level}] {msg}")
 
 
 def ensure_dir(path: Path, *, args: argparse.Namespace) -> None:
@@ -65,12 +97,54 @@ def ensure_dir(path: Path, *, args: argparse.Namespace) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+def _copyfile(src: Path, dst: Path) -> Path:
+    """Copy file data like shutil.copyfile, using os.copy_file_range where available.
+
+    copy_file_range keeps the copy in the kernel and can reflink on filesystems such as
+    btrfs or XFS. The size and same-file check come from fstat() on the already-open
+    descriptors, so no path is stat()ed. Filesystems that reject copy_file_range, and
+    copies that end short of the source size, are redone through the same handles with
+    shutil.copyfileobj. Platforms without copy_file_range use shutil.copyfile.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return shutil.copyfile(src, dst)
+    with open(src, "rb") as fsrc:
+        in_fd = fsrc.fileno()
+        st = os.fstat(in_fd)
+        # Open without O_TRUNC so copying a file onto itself is detected before any data is lost
+        out_fd = os.open(dst, os.O_WRONLY | os.O_CREAT, 0o666)
+        with open(out_fd, "wb") as fdst:
+            if os.path.samestat(st, os.fstat(out_fd)):
+                raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+            os.ftruncate(out_fd, 0)
+            size = st.st_size
+            copied = 0
+            try:
+                # Loop on short copies. Some filesystems return 0 before all data
+                # is copied, so 0 only ends the loop; the total is checked below.
+                while copied < size:
+                    n = os.copy_file_range(in_fd, out_fd, size - copied)
+                    if not n:
+                        break
+                    copied += n
+            except OSError as e:
+                if e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+                    raise
+            if copied != size:
+                # Unsupported or incomplete in-kernel copy: redo it in user space
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst)
+    return dst
+
+
 def copy_file(src: Path, dst: Path, *, args: argparse.Namespace) -> None:
     if args.dry_run:
         log(f"Would copy {src} -> {dst}", v=0, args=args)
         return
     dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(src, dst)
+    _copyfile(src, dst)
     log(f"Copied {src} -> {dst}", v=1, args=args)
 
 
@@ -79,38 +153,57 @@ def copy_tree(src_dir: Path, dst_dir: Path, *, args: argparse.Namespace) -> None
         log(f"Would copy directory {src_dir} -> {dst_dir}", v=0, args=args)
         return
     dst_dir.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copytree(src_dir, dst_dir, dirs_exist_ok=True)
+    shutil.copytree(src_dir, dst_dir, dirs_exist_ok=True, copy_function=_copyfile)
     log(f"Copied directory {src_dir} -> {dst_dir}", v=1, args=args)
 
 
+def _job_value_node(loader: _SafeLoader, node: Optional[yaml.Node]) -> Optional[yaml.Node]:
+    """Return the value node of the 'job' key if node is a mapping that has one."""
+    if not isinstance(node, yaml.MappingNode):
+        return None
+    # Expand '<<' merge keys in place, as constructing the mapping would
+    loader.flatten_mapping(node)
+    job_node = None
+    for key_node, value_node in node.value:
+        # Later duplicate keys win, as they would when constructing a dict
+        if isinstance(key_node, yaml.ScalarNode) and key_node.value == "job":
+            job_node = value_node
+    return job_node
+
+
 def read_tests_job_mapping(tests_yaml_path: Path) -> Optional[dict]:
     """Extract the 'job' mapping from an IWC tests YAML file.
 
     Supports both list-root and dict-root formats.
+    The document is only composed into a node graph; just the selected 'job'
+    subtree is constructed into Python objects, so large 'outputs' sections
+    are never materialized.
     Returns the mapping or None if not found or on YAML errors.
     """
+    job_data = None
     try:
         with tests_yaml_path.open("r", encoding="utf-8") as fh:
-            data = yaml.safe_load(fh)
+            loader = _SafeLoader(fh)
+            try:
+                root = loader.get_single_node()
+                if isinstance(root, yaml.SequenceNode):
+                    # Common format: list of docs, each a mapping with 'doc', 'job', 'outputs', ...
+                    for item in root.value:
+                        job_node = _job_value_node(loader, item)
+                        if job_node is not None:
+                            job_data = loader.construct_document(job_node)
+                            if job_data:
+                                break
+                else:
+                    job_node = _job_value_node(loader, root)
+                    if job_node is not None:
+                        job_data = loader.construct_document(job_node)
+            finally:
+                loader.dispose()
     except Exception as e:
         log(f"Failed to read tests YAML {tests_yaml_path}: {e}", level="WARN")
         return None
 
-    job_data = None
-    try:
-        if isinstance(data, list) and data:
-            # Common format: list of docs, each a mapping with 'doc', 'job', 'outputs', ...
-            for item in data:
-                if isinstance(item, dict) and "job" in item:
-                    job_data = item.get("job")
-                    if job_data:
-                        break
-        elif isinstance(data, dict):
-            job_data = data.get("job")
-    except Exception as e:
-        log(f"Error parsing tests YAML structure {tests_yaml_path}: {e}", level="WARN")
-        return None
-
     if not isinstance(job_data, dict):
         return None
     return job_data
@@ -121,96 +214,146 @@ def write_job_yaml(job_mapping: dict, out_path: Path, *, args: argparse.Namespac
         log(f"Would write job YAML to {out_path}", v=0, args=args)
         return
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", encoding="utf-8") as fh:
-        yaml.safe_dump(job_mapping, fh, default_flow_style=False, sort_keys=False)
+    # Serialize in memory and write once, rather than one write() per emitted line
+    buf = yaml.dump(job_mapping, Dumper=_SafeDumper, default_flow_style=False, sort_keys=False)
+    out_path.write_bytes(buf.encode("utf-8"))
     log(f"Wrote job YAML: {out_path}", v=1, args=args)
 
 
-def find_ga_files(dir_path: Path) -> List[Path]:
-    return [p for p in dir_path.iterdir() if p.is_file() and p.suffix == ".ga"]
+@functools.lru_cache(maxsize=1024)
+def _norm_name(s: str) -> str:
+    """Normalize a filename stem for matching: hyphen/underscore and case folded."""
+    return s.replace("-", "_").lower()
 
 
-def find_tests_files(dir_path: Path) -> List[Path]:
-    files = []
-    for p in dir_path.iterdir():
-        if p.is_file() and p.suffix.lower() == ".yml":
-            lower_name = p.name.lower()
-            if any(lower_name.endswith(suf) for suf in TEST_SUFFIXES):
-                files.append(p)
-    return files
+if _Prefix is not None:
+    def _common_prefix_len(a: str, b: str) -> int:
+        return int(_Prefix.similarity(a, b))
+else:
+    def _common_prefix_len(a: str, b: str) -> int:
+        return len(os.path.commonprefix([a, b]))
 
 
-def similarity_score(a: str, b: str) -> int:
-    """A simple similarity metric for filenames: higher is better.
-    Compares normalized names with hyphen/underscore and case folded.
-    """
-    def norm(s: str) -> str:
-        return s.replace("-", "_").lower()
-
-    a_n, b_n = norm(a), norm(b)
+@functools.lru_cache(maxsize=1024)
+def _score_norm(a_n: str, b_n: str) -> int:
+    """A simple similarity metric for normalized filenames: higher is better."""
     score = 0
     if a_n == b_n:
         score += 10
     # Shared prefix length bonus
-    prefix = os.path.commonprefix([a_n, b_n])
-    score += len(prefix)
+    score += _common_prefix_len(a_n, b_n)
     return score
 
 
-def pick_matching_tests(ga: Path, tests_files: List[Path]) -> Optional[Path]:
+def pick_matching_tests(ga_stem: str, tests_files: List[NameStem]) -> Optional[NameStem]:
     if not tests_files:
         return None
     if len(tests_files) == 1:
         return tests_files[0]
     # Pick the tests file with the best name match to the GA stem
-    ga_stem = ga.stem
-    best = max(tests_files, key=lambda t: similarity_score(ga_stem, t.stem))
+    ga_n = _norm_name(ga_stem)
+    best = max(tests_files, key=lambda t: _score_norm(ga_n, _norm_name(t[1])))
     return best
 
 
-def process_directory(src_dir: Path, dst_dir: Path, *, args: argparse.Namespace) -> None:
+def process_directory(
+    src_dir: Path,
+    dst_dir: Path,
+    ga_files: List[NameStem],
+    tests_files: List[NameStem],
+    readme: Optional[str],
+    test_data_dirs: List[str],
+    *,
+    args: argparse.Namespace,
+) -> None:
     # Always ensure directory exists in output to replicate structure
     ensure_dir(dst_dir, args=args)
 
     # Copy README.md if present
-    readme = src_dir / "README.md"
-    if readme.exists():
-        copy_file(readme, dst_dir / readme.name, args=args)
+    if readme is not None:
+        copy_file(src_dir / readme, dst_dir / readme, args=args)
 
     # Copy test data directories recursively if present (support both names)
-    for test_dir_name in ("test_data", "test-data"):
-        test_data_src = src_dir / test_dir_name
-        if test_data_src.exists() and test_data_src.is_dir():
-            test_data_dst = dst_dir / test_dir_name
-            copy_tree(test_data_src, test_data_dst, args=args)
-
-    ga_files = find_ga_files(src_dir)
-    tests_files = find_tests_files(src_dir)
+    for test_dir_name in test_data_dirs:
+        copy_tree(src_dir / test_dir_name, dst_dir / test_dir_name, args=args)
 
     # Copy all GA files
-    for ga in ga_files:
-        copy_file(ga, dst_dir / ga.name, args=args)
+    for ga_name, _ in ga_files:
+        copy_file(src_dir / ga_name, dst_dir / ga_name, args=args)
 
     # Generate job YAML for each GA if we can find a matching tests file
-    for ga in ga_files:
-        matched_tests = pick_matching_tests(ga, tests_files)
+    for ga_name, ga_stem in ga_files:
+        matched_tests = pick_matching_tests(ga_stem, tests_files)
         if not matched_tests:
             if tests_files:
                 # There are tests files but none matched well; pick the first to be helpful
                 matched_tests = tests_files[0]
             else:
-                log(f"No tests YAML found for {ga}", level="INFO", v=1, args=args)
+                log(f"No tests YAML found for {src_dir / ga_name}", level="INFO", v=1, args=args)
                 continue
 
-        job_mapping = read_tests_job_mapping(matched_tests)
+        tests_path = src_dir / matched_tests[0]
+        job_mapping = read_tests_job_mapping(tests_path)
         if not job_mapping:
-            log(f"No 'job' mapping found in {matched_tests}", level="INFO", v=1, args=args)
+            log(f"No 'job' mapping found in {tests_path}", level="INFO", v=1, args=args)
             continue
 
-        out_job_path = dst_dir / f"{ga.stem}.yml"
+        out_job_path = dst_dir / f"{ga_stem}.yml"
         write_job_yaml(job_mapping, out_job_path, args=args)
 
 
+def scan_workflow_dir(
+    dir_path: Path,
+) -> Tuple[List[NameStem], List[NameStem], Optional[str], List[str], List[Path]]:
+    """Classify the entries of a single directory in one os.scandir() pass.
+
+    Returns (ga_files, tests_files, readme, test_data_dirs, subdirs). Files and test
+    data directories are reported by name (GA and tests files as (name, stem) pairs),
+    so the hot path works on plain strings; only subdirectories are built as Paths.
+    Type checks use the cached DirEntry info.
+    Symlinked directories are reported as test data when named so, but never as
+    subdirectories to descend into (matching os.walk defaults). Directories in
+    SKIP_DIRS are not reported as subdirectories either.
+    """
+    ga_files: List[NameStem] = []
+    tests_files: List[NameStem] = []
+    readme: Optional[str] = None
+    test_data_dirs: List[str] = []
+    subdirs: List[Path] = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            name = entry.name
+            if entry.is_dir():
+                if name in TEST_DATA_DIRS:
+                    test_data_dirs.append(name)
+                if name not in SKIP_DIRS and not entry.is_symlink():
+                    subdirs.append(Path(entry.path))
+            elif entry.is_file():
+                if name.endswith(".ga"):
+                    ga_files.append((name, name.rpartition(".")[0]))
+                elif name[-_TEST_SUFFIX_LEN:].lower().endswith(TEST_SUFFIXES):
+                    tests_files.append((name, name.rpartition(".")[0]))
+                elif name == "README.md":
+                    readme = name
+    return ga_files, tests_files, readme, test_data_dirs, subdirs
+
+
+def _walk(path: Path) -> Iterator[Tuple[Path, List[NameStem], List[NameStem], Optional[str], List[str]]]:
+    """Walk the tree top-down, scanning each directory exactly once.
+
+    Yields (dir_path, ga_files, tests_files, readme, test_data_dirs) for every directory.
+    Like os.walk, unreadable directories are skipped silently.
+    """
+    try:
+        ga_files, tests_files, readme, test_data_dirs, subdirs = scan_workflow_dir(path)
+    except OSError:
+        return
+
+    yield path, ga_files, tests_files, readme, test_data_dirs
+    for subdir in subdirs:
+        yield from _walk(subdir)
+
+
 def main() -> int:
     args = parse_args()
 
@@ -223,14 +366,17 @@ def main() -> int:
 
     log(f"Replicating structure from {workflows_dir} -> {output_dir}", v=0, args=args)
 
-    # Walk the tree
-    for root, dirs, files in os.walk(workflows_dir):
-        src_dir = Path(root)
+    # Walk the tree serially first; scanning is cheap compared to the copies and YAML work
+    work = []
+    for src_dir, ga_files, tests_files, readme, test_data_dirs in _walk(workflows_dir):
         rel = src_dir.relative_to(workflows_dir)
         dst_dir = output_dir / rel
+        work.append((src_dir, dst_dir, ga_files, tests_files, readme, test_data_dirs))
 
-        # Process this directory (create, copy README/.ga, generate job yml)
-        process_directory(src_dir, dst_dir, args=args)
+    # Process each directory (create, copy README/.ga, generate job yml) in a thread pool.
+    # Consuming the results re-raises the first error, as the sequential loop would.
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        list(ex.map(lambda w: process_directory(*w, args=args), work))
 
     log("Done", v=0, args=args)
     return 0
@@ -1,11 +1,31 @@
 import argparse
-import urllib
+import collections
+import functools
 import subprocess
 import re
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from bioblend.galaxy import GalaxyInstance
+from requests.adapters import HTTPAdapter
+
+# orjson is optional; it decodes large API responses faster than the stdlib json module
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+
+# Matches "Invocation <...>" in planemo output, capturing the part inside the angle brackets.
+_INVOCATION_RE = re.compile(r"Invocation <([^>]+)>")
+# Lines of planemo output kept after the invocation ID, for reporting later failures
+_OUTPUT_TAIL_LINES = 1000
+
+# Concurrent per-job detail requests; the session pool is sized to keep them all alive
+JOB_FETCH_WORKERS = 8
+_HTTP_POOL_SIZE = 16
 
 
 class APIError(Exception):
@@ -17,17 +37,29 @@ class GalaxyWrap:
 
     def __init__(self, url, key):
         self.url = url
+        # Normalized once so endpoints can be appended without urljoin on every request
+        self._base = url if url.endswith("/") else url + "/"
         self.gi = GalaxyInstance(url, key)
+        # A shared session keeps connections alive across requests and threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=_HTTP_POOL_SIZE, pool_maxsize=_HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def make_get_request(self, endpoint, **kwargs):
-        response = self.gi.make_get_request(
-            urllib.parse.urljoin(self.url, endpoint), params=dict(**kwargs)
+        # Same headers, timeout and TLS verification bioblend would use for the request
+        response = self.session.get(
+            self._base + endpoint.lstrip("/"),
+            params=dict(**kwargs),
+            headers=self.gi.json_headers,
+            timeout=self.gi.timeout,
+            verify=self.gi.verify,
         )
 
         if response.status_code != 200:
-            raise APIError(response.json()["err_msg"])
+            raise APIError(_json_loads(response.content)["err_msg"])
 
-        return response.json()
+        return _json_loads(response.content)
 
     def get_jobs(self, **kwargs):
         return self.make_get_request("api/jobs", **kwargs)
@@ -37,13 +69,42 @@ class GalaxyWrap:
 
 
 def get_invocation_jobs(gw, invocation_id: str) -> list[dict]:
+    """
+    Returns the jobs of an invocation, each including its copied_from_job_id.
+
+    Job list entries that already carry copied_from_job_id are used as they are;
+    only entries without it are fetched individually, concurrently, so servers that
+    include the field in the list response cost a single request.
+    """
     jobs = gw.get_jobs(invocation_id=invocation_id)
-    return [gw.get_job_by_id(job["id"]) for job in jobs]
+    missing = [i for i, job in enumerate(jobs) if "copied_from_job_id" not in job]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(JOB_FETCH_WORKERS, len(missing))) as ex:
+            details = ex.map(gw.get_job_by_id, [jobs[i]["id"] for i in missing])
+            for i, job in zip(missing, details):
+                jobs[i] = job
+    return jobs
 
 
 def count_copied_invocation_jobs(gw:GalaxyWrap, invocation_id:str) -> dict:
     jobs = get_invocation_jobs(gw, invocation_id)
-    return {"copied": len([job for job in jobs if job["copied_from_job_id"] is not None]), "total": len(jobs), "invocation_id": invocation_id}
+    copied = sum(1 for job in jobs if job["copied_from_job_id"] is not None)
+    return {"copied": copied, "total": len(jobs), "invocation_id": invocation_id}
+
+
+def any_uncopied(gw: GalaxyWrap, invocation_id: str) -> bool:
+    """
+    Returns True as soon as one job of the invocation turns out not to be copied.
+
+    Job details are fetched lazily, one at a time, so the remaining jobs are never
+    requested once a non-copied job is found.
+    """
+    for job in gw.get_jobs(invocation_id=invocation_id):
+        if "copied_from_job_id" not in job:
+            job = gw.get_job_by_id(job["id"])
+        if job["copied_from_job_id"] is None:
+            return True
+    return False
 
 
 def invocation_jobs_are_copied(
@@ -52,15 +113,27 @@ def invocation_jobs_are_copied(
     """
     Validates that the invocation consists of copied jobs.
     """
-    cnt = count_copied_invocation_jobs(gw, invocation_id)
-    return cnt["copied"] == cnt["total"]
+    return not any_uncopied(gw, invocation_id)
 
 
 
 
+@functools.cache
+def _planemo_env() -> dict:
+    """
+    The environment for planemo subprocesses, computed once per process.
+
+    Problematic environment variables that might leak the current virtual
+    environment into the subprocess are removed.
+    """
+    # Optionally also drop VIRTUAL_ENV if planemo still complains,
+    # though PYTHONPATH is usually the main culprit.
+    return {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+
+
 def run_planemo_and_get_invocation_id(command):
     """
-    Runs a planemo command, captures its output, and extracts the invocation ID.
+    Runs a planemo command, streams its output, and extracts the invocation ID.
 
     Args:
         command: A list of strings representing the command to be executed.
@@ -70,30 +143,36 @@ def run_planemo_and_get_invocation_id(command):
     """
 
     try:
-        # Create a copy of the current environment
-        env = os.environ.copy()
-
-        # Remove problematic environment variables that might leak the current
-        # virtual environment into the subprocess
-        env.pop('PYTHONPATH', None)
-        # Optionally unset VIRTUAL_ENV if planemo still complains,
-        # though PYTHONPATH is usually the main culprit.
-        # env.pop('VIRTUAL_ENV', None)
-
-        process = subprocess.run(
+        # The output from planemo often goes to stderr, so both streams are merged
+        # and scanned line by line as they arrive instead of being buffered whole
+        match = None
+        # Everything up to and including the ID line, then a bounded tail of what follows
+        head_lines = []
+        tail_lines = collections.deque(maxlen=_OUTPUT_TAIL_LINES)
+        tail_seen = 0
+        with subprocess.Popen(
             command,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            check=True,
-            env=env  # Pass the sanitized environment
-        )
-
-        # The output from planemo often goes to stderr, so we check both stdout and stderr
-        output = process.stdout + process.stderr
-
-        # Use regular expression to find the invocation ID
-        # This pattern looks for "Invocation <...>" and captures the part inside the angle brackets.
-        match = re.search(r"Invocation <([^>]+)>", output)
+            bufsize=1,
+            env=_planemo_env()  # Pass the sanitized environment
+        ) as process:
+            # Keep draining after a match so planemo never blocks on a full pipe
+            for line in process.stdout:
+                if match is None:
+                    head_lines.append(line)
+                    match = _INVOCATION_RE.search(line)
+                else:
+                    tail_lines.append(line)
+                    tail_seen += 1
+
+        omitted = tail_seen - len(tail_lines)
+        if omitted:
+            head_lines.append(f"... {omitted} lines omitted ...\n")
+        output = "".join(head_lines) + "".join(tail_lines)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, output=output, stderr="")
 
         if match:
             invocation_id = match.group(1)
@@ -117,7 +196,9 @@ def run_planemo_and_get_invocation_id(command):
         return None
 
 
-def run_workflow_and_check_cache(workflow_file: str, job_file: str, galaxy_url: str, galaxy_user_key: str) -> dict:
+def run_workflow_and_check_cache(
+        workflow_file: str, job_file: str, galaxy_url: str, galaxy_user_key: str, gw: GalaxyWrap | None = None
+) -> dict:
     """
     Run a Galaxy workflow via planemo, rerun it with cache, and verify that the rerun
     consists of copied jobs.
@@ -125,6 +206,9 @@ def run_workflow_and_check_cache(workflow_file: str, job_file: str, galaxy_url:
     This is a pure function (no argparse or sys.exit). It raises exceptions on errors
     and returns a result dictionary on success.
 
+    Callers checking many workflows against the same Galaxy can pass a shared
+    GalaxyWrap as gw to reuse its connection; otherwise one is created here.
+
     Returns a dict with keys:
       - invocation_id: str
       - rerun_invocation_id: str
@@ -159,7 +243,8 @@ def run_workflow_and_check_cache(workflow_file: str, job_file: str, galaxy_url:
         raise RuntimeError("Could not get invocation ID from the rerun.")
 
     # Check if the rerun jobs are copied
-    gw = GalaxyWrap(galaxy_url, galaxy_user_key)
+    if gw is None:
+        gw = GalaxyWrap(galaxy_url, galaxy_user_key)
     count_data = count_copied_invocation_jobs(gw, rerun_invocation_id)
     success = count_data["copied"] == count_data["total"] and count_data["total"] > 0
 